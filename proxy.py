@@ -1,5 +1,10 @@
 #!/usr/bin/env python3
+import os
+import select
+import selectors
+import signal
 import subprocess
+import sys
 import threading
 import time
 import logging
@@ -30,6 +35,30 @@ class ProxyServer:
         self._proc: subprocess.Popen | None = None
         self._thread: threading.Thread | None = None
 
+        # Eventfd used to wake the run loop the moment stop() is called,
+        # instead of waiting for the next poll interval (Linux only).
+        self._stop_evfd: int | None = None
+        if hasattr(os, "pidfd_open") and hasattr(os, "eventfd"):
+            self._stop_evfd = os.eventfd(0, os.EFD_NONBLOCK | os.EFD_CLOEXEC)
+
+        # kqueue equivalent for macOS/BSD: NOTE_EXIT on the child plus a
+        # user event triggered by stop().
+        self._kq: "select.kqueue | None" = None
+        if self._stop_evfd is None and sys.platform.startswith(("darwin", "freebsd")):
+            self._kq = select.kqueue()
+
+        # Self-pipe for the last-resort path: lets stop() interrupt the
+        # wait immediately instead of being noticed a sleep interval later.
+        # POSIX only - Windows select() rejects pipes, so the fallback
+        # there waits on the stop Event instead.
+        self._stop_r: int | None = None
+        self._stop_w: int | None = None
+        if self._stop_evfd is None and self._kq is None and os.name == "posix":
+            self._stop_r, self._stop_w = os.pipe()
+            for fd in (self._stop_r, self._stop_w):
+                os.set_blocking(fd, False)
+                os.set_inheritable(fd, False)
+
     def start(self) -> None:
         if self._thread and self._thread.is_alive():
             logging.warning("ProxyServer thread already running")
@@ -45,16 +74,40 @@ class ProxyServer:
     def stop(self, timeout: float | None = 10.0) -> None:
         logging.info("Stopping Proxy server …")
         self._stop_event.set()
+        if self._stop_evfd is not None:
+            os.eventfd_write(self._stop_evfd, 1)
+        if self._kq is not None:
+            # KQ_EV_ADD makes this safe even before _wait_kqueue has
+            # registered the user event (registration is idempotent)
+            try:
+                self._kq.control(
+                    [
+                        select.kevent(
+                            1,
+                            filter=select.KQ_FILTER_USER,
+                            flags=select.KQ_EV_ADD | select.KQ_EV_CLEAR,
+                            fflags=select.KQ_NOTE_TRIGGER,
+                        )
+                    ],
+                    0,
+                )
+            except OSError:
+                pass
+        if self._stop_w is not None:
+            try:
+                os.write(self._stop_w, b"\x00")
+            except BlockingIOError:
+                pass
 
         if self._proc and self._proc.poll() is None:
             logging.info("Terminating JVM …")
-            self._proc.terminate()
+            self._signal_tree()
             try:
                 self._proc.wait(timeout=timeout)
                 logging.info("JVM exited gracefully")
             except subprocess.TimeoutExpired:
                 logging.warning("JVM did not exit in time – killing")
-                self._proc.kill()
+                self._signal_tree(kill=True)
                 self._proc.wait()
 
         if self._thread:
@@ -67,10 +120,122 @@ class ProxyServer:
         self._thread = None
         self._proc = None
         self._stop_event.clear()
+        if self._stop_evfd is not None:
+            try:
+                os.eventfd_read(self._stop_evfd)
+            except BlockingIOError:
+                pass
+        if self._kq is not None:
+            try:
+                self._kq.control(
+                    [select.kevent(1, filter=select.KQ_FILTER_USER, flags=select.KQ_EV_DELETE)],
+                    0,
+                )
+            except OSError:
+                pass
+        if self._stop_r is not None:
+            try:
+                while os.read(self._stop_r, 64):
+                    pass
+            except BlockingIOError:
+                pass
 
     def set_version(self, ver: str):
       self.version = ver
 
+    def _signal_tree(self, *, kill: bool = False) -> None:
+        """Signal the child's whole process group so helpers it spawned are not orphaned."""
+        if os.name == "posix":
+            try:
+                os.killpg(os.getpgid(self._proc.pid), signal.SIGKILL if kill else signal.SIGTERM)
+                return
+            except (ProcessLookupError, PermissionError):
+                pass
+        if kill:
+            self._proc.kill()
+        else:
+            self._proc.terminate()
+
+    def _wait_pidfd(self) -> bool:
+        """Sleep in the kernel until the child exits or stop() fires.
+
+        Returns False when pidfd waiting turns out to be unavailable.
+        """
+        try:
+            pidfd = os.pidfd_open(self._proc.pid, 0)
+        except OSError:
+            # hasattr() is not enough: the syscall itself can fail on
+            # kernels < 5.3 or under seccomp profiles that deny it
+            return False
+        sel = selectors.DefaultSelector()
+        try:
+            sel.register(pidfd, selectors.EVENT_READ, "exit")
+            sel.register(self._stop_evfd, selectors.EVENT_READ, "stop")
+            for key, _ in sel.select():
+                if key.data == "exit":
+                    self._proc.wait()
+        finally:
+            sel.close()
+            os.close(pidfd)
+        return True
+
+    def _wait_kqueue(self) -> None:
+        """Sleep in kevent() until the child exits or stop() fires."""
+        try:
+            self._kq.control(
+                [
+                    select.kevent(
+                        self._proc.pid,
+                        filter=select.KQ_FILTER_PROC,
+                        flags=select.KQ_EV_ADD | select.KQ_EV_ONESHOT,
+                        fflags=select.KQ_NOTE_EXIT,
+                    ),
+                    select.kevent(1, filter=select.KQ_FILTER_USER, flags=select.KQ_EV_ADD | select.KQ_EV_CLEAR),
+                ],
+                0,
+            )
+        except OSError:
+            # ESRCH: the child exited before we could register for it.
+            # Fall back to polling so the exit (or a stop) is still seen.
+            while not self._stop_event.is_set():
+                if self._proc.poll() is not None:
+                    return
+                self._stop_event.wait(0.15)
+            return
+        for ev in self._kq.control(None, 1, None):
+            if ev.filter == select.KQ_FILTER_PROC:
+                self._proc.wait()
+
+    def _wait_for_exit(self) -> None:
+        """Block until the child exits or a stop is requested."""
+        if self._stop_evfd is not None:
+            if self._wait_pidfd():
+                return
+            # Degrade to the self-pipe fallback for good; stop() still
+            # sets the Event, so only the wakeup mechanism changes
+            logging.warning("pidfd_open unavailable – falling back to polling")
+            self._stop_evfd = None
+            self._stop_r, self._stop_w = os.pipe()
+            for fd in (self._stop_r, self._stop_w):
+                os.set_blocking(fd, False)
+                os.set_inheritable(fd, False)
+
+        if self._kq is not None:
+            self._wait_kqueue()
+            return
+
+        # Fallback for platforms without pidfd_open/eventfd or kqueue:
+        # select() on the self-pipe returns as soon as stop() writes to it,
+        # while exits are still caught on a short bounded cadence. Without
+        # a pipe (Windows), the Event gives the same stop latency.
+        while not self._stop_event.is_set():
+            if self._proc.poll() is not None:
+                return
+            if self._stop_r is not None:
+                select.select([self._stop_r], [], [], 0.15)
+            else:
+                self._stop_event.wait(0.15)
+
     def _run_loop(self) -> None:
         version = self.version
 
@@ -99,27 +264,27 @@ class ProxyServer:
         while not self._stop_event.is_set():
             try:
                 logging.info("Launching ViaProxy: %s", " ".join(cmd))
+                if os.name == "posix":
+                    popen_kwargs: Dict[str, Any] = {"start_new_session": True}
+                else:
+                    popen_kwargs = {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
                 self._proc = subprocess.Popen(
                     cmd,
                     cwd=self.cwd,
+                    **popen_kwargs,
                 )
 
-                while True:
-                    if self._stop_event.is_set():
-                        logging.info("Stop requested – shutting down ViaProxy")
-                        self._proc.terminate()
-                        self._proc.wait()
-                        return
-
-                    ret = self._proc.poll()
-                    if ret is not None:
-                        break
-
-                    time.sleep(0.5)
+                self._wait_for_exit()
 
                 if self._stop_event.is_set():
+                    logging.info("Stop requested – shutting down ViaProxy")
+                    if self._proc.poll() is None:
+                        self._signal_tree()
+                        self._proc.wait()
                     return
 
+                ret = self._proc.poll()
+
                 if ret == 0:
                     logging.info("ViaProxy exited cleanly (code 0) – restarting")
                 else:
@@ -4,57 +4,101 @@ import re
 import sys
 import json
 import time
-import signal
+import queue
+import threading
 from datetime import datetime, timezone, timedelta
+from functools import lru_cache
 from pathlib import Path
 from typing import List, Tuple, Optional, Any, Dict, Union, Pattern
-import requests
-import shutil
-import subprocess
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 from server import start_server_in_background, JavaServer
 from proxy import start_proxy_in_background, ProxyServer
 
 VERSION_RE = re.compile(r"^(\d+)\.(\d+)(?:\.(\d+))?$")
 
+# Pre-1.14 servers want these settings as numeric codes
+DIFFICULTY = {"peaceful": 0, "easy": 1, "normal": 2, "hard": 3}
+GAMEMODE = {"survival": 0, "creative": 1, "adventure": 2}
+
+FICLONE = 0x40049409
+
+
+def _reflink_copy(src: str, dst: str) -> str:
+    # copytree copy_function that lets the kernel clone or move the data
+    # (reflink on btrfs/xfs, in-kernel copy elsewhere) instead of pumping
+    # every byte through userspace; worlds can be gigabytes
+    import shutil
+
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        if hasattr(os, "copy_file_range"):
+            try:
+                size = os.fstat(fsrc.fileno()).st_size
+                copied = 0
+                while copied < size:
+                    n = os.copy_file_range(fsrc.fileno(), fdst.fileno(), size - copied)
+                    if n == 0:
+                        break
+                    copied += n
+                if copied == size:
+                    shutil.copystat(src, dst)
+                    return dst
+            except OSError:
+                pass
+        if fcntl is not None:
+            try:
+                fdst.truncate(0)
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+                shutil.copystat(src, dst)
+                return dst
+            except OSError:
+                pass
+    return shutil.copy2(src, dst)
+
+
+@lru_cache(maxsize=512)
+def _compile_pattern(pattern: str) -> Pattern[str]:
+    return re.compile(pattern)
+
+
+@lru_cache(maxsize=8)
+def _keys_re(keys: Tuple[str, ...]) -> Pattern[str]:
+    # Anchored with ^ and = so keys only match at the start of their own
+    # line, never inside another line's value
+    return re.compile(r"^\s*(" + "|".join(map(re.escape, keys)) + r")\s*=")
+
 
 def replace_line_in_file(
     filename: Union[str, Path],
     pattern: Union[str, Pattern[str]],
     replacement: str,
-    *,
-    replace_first: bool = False,
 ) -> bool:
     file_path = Path(filename)
 
     lines = file_path.read_text(encoding="utf-8").splitlines(True)
 
     if isinstance(pattern, str):
-        pattern = re.compile(pattern)
+        pattern = _compile_pattern(pattern)
 
-    new_lines = []
     replaced = False
 
-    for line in lines:
-        if not replaced and pattern.search(line):
-            new_lines.append(replacement + ("\n" if line.endswith("\n") else ""))
+    for i, line in enumerate(lines):
+        if pattern.search(line):
+            lines[i] = replacement + ("\n" if line.endswith("\n") else "")
             replaced = True
-            if replace_first:
-                new_lines.extend(lines[lines.index(line) + 1:])
-                break
-        else:
-            new_lines.append(line)
+            break
 
     if replaced:
-        file_path.write_text("".join(new_lines), encoding="utf-8")
+        file_path.write_text("".join(lines), encoding="utf-8")
 
     return replaced
 
 
-def apply_properties(version: Tuple[int, int, int]):
-    data = json.loads(Path("properties.json").read_text(encoding="utf-8"))
-
+def _flatten(data: Any) -> Dict[str, Any]:
     result: Dict[str, Any] = {}
-    
+
     def _walk(node: Any, prefix: str = "") -> None:
         if isinstance(node, dict):
             for k, v in node.items():
@@ -66,34 +110,54 @@ def apply_properties(version: Tuple[int, int, int]):
             result[prefix[:-1]] = node
 
     _walk(data)
+    return result
+
 
-    for key in result:
-        if key == "difficulty" and version[1] < 14:
-            match result[key]:
-                case "peaceful":
-                    result[key] = 0
-                case "easy":
-                    result[key] = 1
-                case "normal":
-                    result[key] = 2
-                case "hard":
-                    result[key] = 3
-        if key == "gamemode" and version[1] < 14:
-            match result[key]:
-                case "survival":
-                    result[key] = 0
-                case "creative":
-                    result[key] = 1
-                case "adventure":
-                    result[key] = 2
-        value = result[key]
-        # Replace setting if it exists
+# Keyed by st_mtime_ns so edits on disk invalidate the cache while
+# the common every-60s case skips the read and JSON parse entirely.
+@lru_cache(maxsize=1)
+def _load_properties(mtime_ns: int) -> Dict[str, Any]:
+    return _flatten(json.loads(Path("properties.json").read_text(encoding="utf-8")))
+
+
+@lru_cache(maxsize=1)
+def _load_settings(mtime_ns: int) -> Dict[str, Any]:
+    return _flatten(json.loads(Path("settings.json").read_text(encoding="utf-8")))
+
+
+def apply_properties(version: Tuple[int, int, int]):
+    # Copy: the difficulty/gamemode rewrites below must not leak into the cache
+    result = dict(_load_properties(os.stat("properties.json").st_mtime_ns))
+
+    if version[1] < 14:
+        if "difficulty" in result:
+            result["difficulty"] = DIFFICULTY.get(result["difficulty"], result["difficulty"])
+        if "gamemode" in result:
+            result["gamemode"] = GAMEMODE.get(result["gamemode"], result["gamemode"])
+
+    values: Dict[str, str] = {}
+    for key, value in result.items():
         if isinstance(value, bool):
-            value = str(value).lower()
+            values[key] = str(value).lower()
         else:
-            value = str(value)
-        replace_line_in_file("current/server.properties", rf"\b{key}\b", f"{key}={value}")
-    
+            values[key] = str(value)
+
+    # Replace all settings that exist in one pass over the file
+    pattern = _keys_re(tuple(values))
+    file_path = Path("current/server.properties")
+    lines = file_path.read_text(encoding="utf-8").splitlines(True)
+    changed = False
+
+    for i, line in enumerate(lines):
+        match = pattern.match(line)
+        if match:
+            key = match.group(1)
+            lines[i] = f"{key}={values[key]}" + ("\n" if line.endswith("\n") else "")
+            changed = True
+
+    if changed:
+        file_path.write_text("".join(lines), encoding="utf-8")
+
     return result
 
 
@@ -108,20 +172,31 @@ def create_version_file():
         print(f"Created current.txt to keep track of currently set version")
 
 
-def get_version() -> Tuple[int, int, int]:
+_state_cache: Optional[Tuple[int, Tuple[Tuple[int, int, int], datetime]]] = None
+
+
+def _read_state() -> Tuple[Tuple[int, int, int], datetime]:
+    # One read serves both get_version and get_update_time, cached on
+    # st_mtime_ns so the every-60s tick only stats the file
+    global _state_cache
     create_version_file()
-    
-    with Path("current.txt").open('r', encoding='utf-8') as f:
-        version_str, ts_str = f.read().splitlines()
-        return parse_version(version_str)
+
+    st = os.stat("current.txt")
+    if _state_cache is not None and _state_cache[0] == st.st_mtime_ns:
+        return _state_cache[1]
+
+    version_str, ts_str = Path("current.txt").read_text(encoding='utf-8').splitlines()
+    parsed = (parse_version(version_str), datetime.fromisoformat(ts_str))
+    _state_cache = (st.st_mtime_ns, parsed)
+    return parsed
+
+
+def get_version() -> Tuple[int, int, int]:
+    return _read_state()[0]
 
 
 def get_update_time():
-    create_version_file()
-    
-    with Path("current.txt").open('r', encoding='utf-8') as f:
-        version_str, ts_str = f.read().splitlines()
-        return datetime.fromisoformat(ts_str)
+    return _read_state()[1]
 
 
 def parse_version(name: str) -> Optional[Tuple[int, int, int]]:
@@ -135,23 +210,26 @@ def parse_version(name: str) -> Optional[Tuple[int, int, int]]:
 
 
 def get_versions() -> List[Tuple[int, int, int]]:
-    base = "servers"
-    items = []
-    items.append(parse_version("0.0.0"))
-    for entry in os.listdir(base):
-        full_path = os.path.join(base, entry)
-        if os.path.isdir(full_path):
-            ver = parse_version(entry)
-            if ver is not None:
-                items.append((ver))
-    items.sort(key=lambda x: x[1])
+    items = [(0, 0, 0)]
+    with os.scandir("servers") as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                ver = parse_version(entry.name)
+                if ver is not None:
+                    items.append(ver)
+    # Sort on the full (major, minor, patch) tuple; keying on the minor
+    # version alone ordered 2.0 before 1.21
+    items.sort()
     return items
 
 
-def upgrade_version(server: Optional[JavaServer] = None, proxy: Optional[ProxyServer] = None):
+def upgrade_version(settings: Dict[str, Any], server: Optional[JavaServer] = None, proxy: Optional[ProxyServer] = None):
+    # Only needed during the (rare) upgrade itself
+    import shutil
+    import subprocess
+
     version = get_version()
     versions = get_versions()
-    settings = get_settings()
 
     previous_version = version
 
@@ -186,14 +264,14 @@ def upgrade_version(server: Optional[JavaServer] = None, proxy: Optional[ProxySe
     os.makedirs("backup", exist_ok=True)
 
     try:
-        shutil.copytree("old", f"backup/{version_to_string(previous_version)}")
+        shutil.copytree("old", f"backup/{version_to_string(previous_version)}", copy_function=_reflink_copy)
     except:
         print("Failed to backup previous version, maybe there is no previous version?")
 
     # Setup the server
     os.makedirs("current", exist_ok=True)
     try:
-        shutil.copytree("old/world", "current/world")
+        shutil.copytree("old/world", "current/world", copy_function=_reflink_copy)
     except:
         print("Failed to copy old world or no old world exists")
     shutil.copy(f"servers/{version_to_string(version)}/server.jar", "current/server.jar")
@@ -202,12 +280,29 @@ def upgrade_version(server: Optional[JavaServer] = None, proxy: Optional[ProxySe
         Path("current/eula.txt").touch(mode=0o666, exist_ok=True)
         Path("current/eula.txt").write_text("eula=true", encoding='utf-8')
 
-    # We run the server for 10 seconds to generate all needed files
+    # We run the server just long enough to generate all needed files,
+    # stopping as soon as they appear instead of waiting a fixed 10 seconds
     print("Generating configuration files")
-    try:
-        subprocess.run(["java", f"-Xmx{settings["java-Xmx"]}", f"-Xms{settings["java-Xms"]}", "-jar", "server.jar", "nogui"], timeout=10, cwd="current")
-    except subprocess.TimeoutExpired as exc:
+    proc = subprocess.Popen(["java", f"-Xmx{settings['java-Xmx']}", f"-Xms{settings['java-Xms']}", "-jar", "server.jar", "nogui"], cwd="current")
+    wanted = (Path("current/server.properties"), Path("current/eula.txt"))
+    deadline = time.monotonic() + 30.0
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            break
+        if all(p.exists() and p.stat().st_size > 0 for p in wanted):
+            break
+        time.sleep(0.25)
+    if proc.poll() is None:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+    if all(p.exists() and p.stat().st_size > 0 for p in wanted):
         print("Configuration files created")
+    else:
+        print("Timed out waiting for configuration files to be generated", file=sys.stderr)
 
     apply_properties(version)
     print("Applied server properties")
@@ -219,33 +314,18 @@ def upgrade_version(server: Optional[JavaServer] = None, proxy: Optional[ProxySe
     if proxy:
         proxy.set_version(version_to_string(version))
         proxy.start()
-    discord_message(f"Updated server to version {version_to_string(version)}!")
+    discord_message(settings, f"Updated server to version {version_to_string(version)}!")
 
 
-def get_settings():
-    data = json.loads(Path("settings.json").read_text(encoding="utf-8"))
+def get_settings() -> Dict[str, Any]:
+    return _load_settings(os.stat("settings.json").st_mtime_ns)
 
-    result: Dict[str, Any] = {}
-    
-    def _walk(node: Any, prefix: str = "") -> None:
-        if isinstance(node, dict):
-            for k, v in node.items():
-                _walk(v, f"{prefix}{k}.")
-        elif isinstance(node, list):
-            for i, v in enumerate(node):
-                _walk(v, f"{prefix}[{i}].")
-        else:
-            result[prefix[:-1]] = node
 
-    _walk(data)
-    return result
-
-
-def check_updates(server: JavaServer, proxy: Optional[ProxyServer] = None):
-    settings = get_settings()
+def check_updates(settings: Dict[str, Any], server: JavaServer, proxy: Optional[ProxyServer] = None):
     update_time = get_update_time()
+    now = datetime.now(timezone.utc)
 
-    if (update_time + timedelta(days=settings["update_frequency_days"])) > datetime.now(timezone.utc):
+    if (update_time + timedelta(days=settings["update_frequency_days"])) > now:
         return
 
     weekday = 0
@@ -266,60 +346,78 @@ def check_updates(server: JavaServer, proxy: Optional[ProxyServer] = None):
         case "sunday":
             weekday = 6
     
-    if datetime.today().weekday() != weekday:
+    if now.weekday() != weekday:
         return
 
-    if settings["update_time_utc"] != datetime.now(timezone.utc).hour:
+    if settings["update_time_utc"] != now.hour:
         return
 
     # Checks passed, update server
-    upgrade_version(server, proxy)
+    upgrade_version(settings, server, proxy)
 
 
-def update_loop(server: JavaServer, proxy: Optional[ProxyServer] = None):
+def update_loop(settings: Dict[str, Any], server: JavaServer, proxy: Optional[ProxyServer] = None):
     while True:
+        # Monotonic deadline: immune to NTP steps and wall-clock jumps
+        deadline = time.monotonic() + 60.0
         try:
-            start = time.time()
-            check_updates(server, proxy)
+            check_updates(settings, server, proxy)
         except Exception as exc:
             print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] Error: {exc!r}")
         finally:
-            elapsed = time.time() - start
-            sleep_time = max(60.0 - elapsed, 0.0)
-            time.sleep(sleep_time)
+            time.sleep(max(deadline - time.monotonic(), 0.0))
+
+
+_discord_queue: "queue.Queue[Tuple[str, str]]" = queue.Queue()
+_discord_thread: Optional[threading.Thread] = None
+
 
+def _discord_worker() -> None:
+    # Imported here so the dependency is only paid when a webhook is
+    # actually configured
+    import requests
 
-def discord_message(message: str):
-    webhook_url = get_settings()["discord_webhook_url"]
+    # One session for the life of the process: TCP/TLS is set up once
+    # and kept alive across all webhook posts
+    session = requests.Session()
+    while True:
+        webhook_url, message = _discord_queue.get()
+        try:
+            response = session.post(webhook_url, json={"content": message}, timeout=5)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as exc:
+            print(f"Failed to send Discord message: {exc}", file=sys.stderr)
+
+
+def discord_message(settings: Dict[str, Any], message: str):
+    webhook_url = settings["discord_webhook_url"]
     if not webhook_url or webhook_url == "":
         return
 
-    payload = {
-        "content": message
-    }
-    headers = {
-        "Content-Type": "application/json"
-    }
+    global _discord_thread
+    if _discord_thread is None:
+        _discord_thread = threading.Thread(
+            target=_discord_worker,
+            name="DiscordWebhookThread",
+            daemon=True,
+        )
+        _discord_thread.start()
 
-    try:
-        response = requests.post(webhook_url, headers=headers, data=json.dumps(payload))
-        response.raise_for_status()
-    except requests.exceptions.RequestException as exc:
-        print(f"Failed to send Discord message: {exc}", file=sys.stderr)
-        return
+    _discord_queue.put((webhook_url, message))
 
 
 def main() -> None:
     settings = get_settings()
     if (version_to_string(get_version()) == "0.0.0"):
-        upgrade_version()
-    apply_properties(get_version())
+        upgrade_version(settings)
+    version = get_version()
+    props = apply_properties(version)
     server = start_server_in_background(settings)
     proxy = None
     if (settings["viaproxy-enable"]):
-        proxy = start_proxy_in_background(settings, version_to_string(get_version()), apply_properties(get_version())["server-port"])
+        proxy = start_proxy_in_background(settings, version_to_string(version), props["server-port"])
     # Make sure update_loop() is the last line, as it loops so nothing after this will run
-    update_loop(server, proxy)
+    update_loop(settings, server, proxy)
 
 
 if __name__ == "__main__":